@@ -1,19 +1,16 @@
 import argparse
 import difflib
+import hashlib
 import math
 import time
 import re
 import logging
 import sqlite3
 import asyncio
-from token import NUMBER
+from itertools import chain
 
 import yaml
-import httpx
-from lxml import html
 from colorama import Fore
-from pypinyin import pinyin
-from plexapi.myplex import PlexServer
 
 
 logging.basicConfig(
@@ -60,7 +57,7 @@ def split_movie_name(movie_name):
     return main_title, part_index, part_title
 
 
-def loadconfig():
+def loadconfig(argv=None):
     def load_form_file(yaml_file_path):
         try:
             with open(yaml_file_path, 'r', encoding='utf-8') as file:
@@ -84,13 +81,22 @@ def loadconfig():
         parser.add_argument('--baseurl', default="", type=str, required=False,
                             help="Plex 地址，例如 http://127.0.0.1:32400")
         parser.add_argument('--token', default="", type=str, required=False, help="Plex Token")
-        args = parser.parse_args()
+        parser.add_argument('--renew', action='store_true', help="忽略本地缓存，重新抓取豆瓣列表")
+        parser.add_argument('--force', action='store_true', help="即使列表自上次同步后没有变化，也重新同步")
+        parser.add_argument('--chunksize', default=250, type=int, required=False,
+                            help="每批抓取、匹配并加入播放列表的条目数，超大列表可以限制内存占用")
+        args = parser.parse_args(argv)
+        if args.chunksize < 1:
+            parser.error("--chunksize 不能小于 1")
 
         class _cfg:
             configfile = args.configfile
             baseurl = args.baseurl
             token = args.token
             playlist = [args.playlist]
+            renew = args.renew
+            force = args.force
+            chunksize = args.chunksize
 
         return _cfg
 
@@ -98,6 +104,9 @@ def loadconfig():
     file_cfg = load_form_file(args_cfg.configfile)
 
     if file_cfg:
+        file_cfg.renew = args_cfg.renew
+        file_cfg.force = args_cfg.force
+        file_cfg.chunksize = args_cfg.chunksize
         return file_cfg
     else:
         if not args_cfg.baseurl or not args_cfg.token:
@@ -116,20 +125,39 @@ def ensure_table_exists(playlist_id):
         cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='playlist';")
         table_exists = cursor.fetchone()
         if not table_exists:
-            # 如果表不存在，创建一个新的表，结构为：id, playlist_name, renew_time
-            cursor.execute(f"""
-                CREATE TABLE {table_name} (
+            # 如果表不存在，创建一个新的表，结构为：id, playlist_name, renew_time, list_hash, synced_hash, synced_library
+            cursor.execute("""
+                CREATE TABLE playlist (
                     id TEXT PRIMARY KEY,
                     name TEXT,
-                    renew_time INTEGER
+                    renew_time INTEGER,
+                    list_hash TEXT,
+                    synced_hash TEXT,
+                    synced_library TEXT
                 );
             """)
             conn.commit()
+        else:
+            # 旧版本创建的 playlist 表缺少部分列
+            cursor.execute("PRAGMA table_info(playlist);")
+            columns = [column[1] for column in cursor.fetchall()]
+            for column in ('list_hash', 'synced_library'):
+                if column not in columns:
+                    cursor.execute(f"ALTER TABLE playlist ADD COLUMN {column} TEXT;")
+            conn.commit()
 
         # 检查是否存在名为 table_name 的表
         cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}';")
         table_exists = cursor.fetchone()
 
+        if table_exists:
+            # 旧版本会把 table_name 错误地建成 playlist 表的结构，删除后重新创建
+            cursor.execute(f"PRAGMA table_info({table_name});")
+            if 'title' not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute(f"DROP TABLE {table_name};")
+                conn.commit()
+                table_exists = None
+
         if not table_exists:
             # 如果表不存在，创建一个新的表，结构为：id, title, original_title, year, imdbid, tmdbid
             cursor.execute(f"""
@@ -152,11 +180,8 @@ def ensure_table_exists(playlist_id):
         if row_count <= 0:
             return False
 
-        # 获取表中的所有行数据
-        cursor.execute(f"SELECT * FROM {table_name};")
-        playlist_data = cursor.fetchall()
-
-        return playlist_data
+        # 只返回行数，数据由 read_data 分批读取
+        return row_count
 
     except sqlite3.Error as e:
         logging.debug(e)
@@ -167,31 +192,62 @@ def ensure_table_exists(playlist_id):
         conn.close()
 
 
-def insert_data(playlist_id, playlist_name, data):
+def insert_data(playlist_id, playlist_name, chunks):
     # 连接到当前目录下的 listcache.db 数据库
     conn = sqlite3.connect('listcache.db')
     cursor = conn.cursor()
     table_name = f'id_{playlist_id}'
+    count = 0
+    # 写入时顺便计算列表内容的摘要，缓存读出的行与新抓取的行格式不同，统一转为字符串后再计算
+    digest = hashlib.sha1()
 
     try:
-        # 清空指定的表
+        # 清空指定的表，与写入在同一个事务中提交，抓取中断时保留原有的缓存
         cursor.execute(f"DELETE FROM {table_name};")
-        conn.commit()
         logging.info(f"已清空 '{table_name}' 的缓存数据。")
 
-        cursor.executemany(
-            f"INSERT INTO {table_name} (id, title, original_title, year, imdbid, tmdbid) VALUES (?, ?, ?, ?, ?, ?);",
-            data)
+        for data in chunks:
+            cursor.executemany(
+                f"INSERT INTO {table_name} (id, title, original_title, year, imdbid, tmdbid) "
+                f"VALUES (?, ?, ?, ?, ?, ?);",
+                data)
+            for item in data:
+                text = '\t'.join(str(field) for field in item)
+                digest.update((f'\n{text}' if count else text).encode('utf-8'))
+                count += 1
 
         # 插入或更新 playlist 表中的数据
         cursor.execute(
-            "INSERT INTO playlist (id, name, renew_time) VALUES (?, ?, ?) "
-            "ON CONFLICT(id) DO UPDATE SET name=excluded.name, renew_time=excluded.renew_time;",
-            (str(playlist_id), str(playlist_name), int(time.time())))
+            "INSERT INTO playlist (id, name, renew_time, list_hash) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET name=excluded.name, renew_time=excluded.renew_time, "
+            "list_hash=excluded.list_hash;",
+            (str(playlist_id), str(playlist_name), int(time.time()), digest.hexdigest()))
 
         conn.commit()
         logging.info(f"已将 {table_name} 的数据缓存。")
 
+    except sqlite3.Error as e:
+        logging.error(f"缓存 {table_name} 的数据失败：{e}")
+        raise
+
+    finally:
+        # 关闭数据库连接
+        conn.close()
+
+    return count
+
+
+def read_data(playlist_id, chunksize):
+    # 连接到当前目录下的 listcache.db 数据库
+    conn = sqlite3.connect('listcache.db')
+    cursor = conn.cursor()
+    table_name = f'id_{playlist_id}'
+
+    try:
+        cursor.execute(f"SELECT * FROM {table_name};")
+        while data := cursor.fetchmany(chunksize):
+            yield data
+
     except sqlite3.Error as e:
         logging.debug(e)
 
@@ -211,7 +267,71 @@ def get_playlistname(playlist_id):
     return name
 
 
+def library_state(baseurl, token):
+    """
+    电影库的更新时间，只发送一次 /library/sections 请求，不需要连接 PlexServer 或读取库中的电影
+    :param baseurl:
+    :param token:
+    :return:
+    """
+    import requests
+
+    response = requests.get(
+        url=f'{baseurl}/library/sections', headers={'X-Plex-Token': token, 'Accept': 'application/json'}
+    )
+    response.raise_for_status()
+    sections = response.json().get("MediaContainer", {}).get("Directory", [])
+    return ','.join(
+        f'{section.get("key")}:{section.get("updatedAt")}:{section.get("contentChangedAt")}'
+        for section in sections if section.get('type') == 'movie'
+    )
+
+
+def playlist_exists(baseurl, token, playlist_name):
+    import requests
+
+    response = requests.get(
+        url=f'{baseurl}/playlists', params={'title': playlist_name},
+        headers={'X-Plex-Token': token, 'Accept': 'application/json'}
+    )
+    response.raise_for_status()
+    playlists = response.json().get("MediaContainer", {}).get("Metadata", [])
+    return any(playlist.get('title') == playlist_name for playlist in playlists)
+
+
+def get_synced_state(playlist_id):
+    # 连接到当前目录下的 listcache.db 数据库
+    conn = sqlite3.connect('listcache.db')
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT list_hash, synced_hash, synced_library FROM playlist WHERE id = ?;",
+                       (str(playlist_id),))
+        row = cursor.fetchone()
+        return row if row else (None, None, None)
+    except sqlite3.Error as e:
+        logging.debug(e)
+        return None, None, None
+    finally:
+        conn.close()
+
+
+def set_synced_state(playlist_id, digest, library):
+    # 连接到当前目录下的 listcache.db 数据库
+    conn = sqlite3.connect('listcache.db')
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE playlist SET synced_hash = ?, synced_library = ? WHERE id = ?;",
+                       (digest, library, str(playlist_id)))
+        conn.commit()
+    except sqlite3.Error as e:
+        logging.debug(e)
+    finally:
+        conn.close()
+
+
 async def fetch_datas(urls):
+    import httpx
+
     async with httpx.AsyncClient() as client:
         tasks = [client.get(url, headers=HEADERS, timeout=2000, follow_redirects=True) for url in urls]
         responses = await asyncio.gather(*tasks)
@@ -219,10 +339,13 @@ async def fetch_datas(urls):
     return html_docs
 
 
-def get_douban_playlist(playlist_id='top250', renew: bool = False):
+def get_douban_playlist(playlist_id='top250', renew: bool = False, chunksize: int = 250):
     cache = ensure_table_exists(playlist_id)
 
     if renew or not cache:
+        import httpx
+        from lxml import html
+
         if playlist_id == 'top250':
             url = f"https://movie.douban.com/top250"
             page = 10
@@ -237,39 +360,50 @@ def get_douban_playlist(playlist_id='top250', renew: bool = False):
             page = math.ceil(item_count / 25)
             playlist_name = html.fromstring(firstpage).xpath('//title/text()')[0]
 
-        # 获取全部页面的内容
         urls = [f"{url}?start={start_index}" for start_index in [i * 25 for i in range(0, page)]]
-        html_docs = asyncio.run(fetch_datas(urls))
-        playlist = []
+        step = max(1, chunksize // 25)
+
+        def fetch_chunks():
+            # 每次只抓取并解析 chunksize 条左右的页面，超大列表不会一次载入全部页面
+            offset = 0
+            for start in range(0, len(urls), step):
+                html_docs = asyncio.run(fetch_datas(urls[start:start + step]))
+                playlist = []
+
+                if playlist_id == 'top250':
+                    itemlist = html.fromstring('\n'.join(html_docs)).xpath('//ol[contains(@class, "grid_view")]/li/div')
+                    for index, item in enumerate(itemlist):
+                        index = item.xpath('./div[contains(@class, "pic")]/em/text()')[0]
+                        title = item.xpath(
+                            './div[contains(@class, "info")]/div/a/span[contains(@class, "title")]/text()')
+                        local_title = title[0]
+                        origin_title = title[1].replace('/', '').strip() if len(title) > 1 else None
+                        bd = item.xpath('./div[contains(@class, "info")]/div[contains(@class, "bd")]/p/text()')
+                        year = remove_punctuation(bd[1].split('/')[0]) if len(bd) > 1 else None
+                        if len(year) > 4:
+                            year = year[0:4]
+
+                        media = (index, local_title, origin_title, year, None, None)
+                        playlist.append(media)
+                else:
+                    itemlist = html.fromstring('\n'.join(html_docs)).xpath(
+                        '//div[contains(@class, "bd doulist-subject")]')
+                    for index, item in enumerate(itemlist, offset):
+                        title = item.xpath('./div[contains(@class, "title")]/a/text()')
+                        local_title = (title[0].strip().split(' ')[0] if title[0].strip()
+                                       else title[1].strip().split(' ')[0])
 
-        if playlist_id == 'top250':
-            itemlist = html.fromstring('\n'.join(html_docs)).xpath('//ol[contains(@class, "grid_view")]/li/div')
-            for index, item in enumerate(itemlist):
-                index = item.xpath('./div[contains(@class, "pic")]/em/text()')[0]
-                title = item.xpath('./div[contains(@class, "info")]/div/a/span[contains(@class, "title")]/text()')
-                local_title = title[0]
-                origin_title = title[1].replace('/', '').strip() if len(title) > 1 else None
-                bd = item.xpath('./div[contains(@class, "info")]/div[contains(@class, "bd")]/p/text()')
-                year = remove_punctuation(bd[1].split('/')[0]) if len(bd) > 1 else None
-                if len(year) > 4:
-                    year = year[0:4]
-
-                media = (index, local_title, origin_title, year, None, None)
-                playlist.append(media)
-        else:
-            itemlist = html.fromstring('\n'.join(html_docs)).xpath('//div[contains(@class, "bd doulist-subject")]')
-            for index, item in enumerate(itemlist):
-                title = item.xpath('./div[contains(@class, "title")]/a/text()')
-                local_title = title[0].strip().split(' ')[0] if title[0].strip() else title[1].strip().split(' ')[0]
+                        year_xml = item.xpath('./div[contains(@class, "abstract")]/text()')
+                        year = remove_punctuation(year_xml[-1].replace('年份', '')) if len(year_xml) > 1 else None
 
-                year_xml = item.xpath('./div[contains(@class, "abstract")]/text()')
-                year = remove_punctuation(year_xml[-1].replace('年份', '')) if len(year_xml) > 1 else None
+                        media = (index, local_title, None, year, None, None)
+                        playlist.append(media)
 
-                media = (index, local_title, None, year, None, None)
-                playlist.append(media)
+                offset += len(itemlist)
+                yield playlist
 
-        insert_data(playlist_id, playlist_name, playlist)
-        return playlist_name, playlist
+        playlist_count = insert_data(playlist_id, playlist_name, fetch_chunks())
+        return playlist_name, playlist_count
     else:
         playlist_name = get_playlistname(playlist_id)
         return playlist_name, cache
@@ -286,7 +420,161 @@ def list_media(pms_client, allow_libs):
     return media_list
 
 
-def main(baseurl: str, token: str, playlist_id='top250', renew=False):
+def index_media(medias):
+    """
+    预先处理库中电影的名称和年份，并按年份建立索引，匹配时只比较上映年份相差不超过 2 年的电影
+    :param medias: list_media 的返回值
+    :return: 处理后的电影列表，以及年份到列表下标的索引
+    """
+    library = []
+    years = {}
+    for media in medias:
+        try:
+            plex_movie, plex_year = remove_punctuation(media[1]), media[3]
+            plex_title, plex_index, plex_part = split_movie_name(plex_movie)
+            plex_fillstring = plex_movie.replace('：', '') + '*' * (11 - len(plex_movie)) + plex_year
+            years.setdefault(int(plex_year), []).append(len(library))
+
+        # 跳过无法提取信息的
+        except Exception as e:
+            logging.debug(e)
+            continue
+
+        library.append((media[0], plex_movie, plex_year, plex_title, plex_index, plex_part, plex_fillstring))
+    return library, years
+
+
+def match_media(item, library, years, consumed, pinyin):
+    """
+    在库中查找与列表条目最匹配的电影
+    :param item: 豆瓣列表中的一个条目
+    :param library: index_media 返回的电影列表
+    :param years: index_media 返回的年份索引
+    :param consumed: 已匹配过的电影下标，不会再参与匹配
+    :param pinyin: pypinyin.pinyin，由调用方导入
+    :return: 电影下标，电影，相似度，匹配存在的问题
+    """
+    temp_index = None
+    temp_media = None
+    temp_ratio = 0
+    massage = ''
+
+    try:
+        list_movie, list_year = remove_punctuation(item[1]), item[3]
+        list_title, list_index, list_part = split_movie_name(list_movie)
+        list_fillstring = list_movie.replace('：', '') + '*' * (11 - len(list_movie)) + list_year
+        list_year_number = int(list_year)
+
+    # 1. 跳过无法提取信息的
+    except Exception as e:
+        logging.debug(e)
+        return temp_index, temp_media, temp_ratio, massage
+
+    # 2. 跳过上映年份差距大于2年的，按库中原有顺序比较
+    candidates = sorted(chain.from_iterable(
+        years.get(year, []) for year in range(list_year_number - 2, list_year_number + 3)
+    ))
+
+    for index in candidates:
+        if index in consumed:
+            continue
+
+        media, plex_movie, plex_year, plex_title, plex_index, plex_part, plex_fillstring = library[index]
+
+        # 3. 跳过有集数但集数不同的情况
+        if list_index != plex_index and list_index and plex_index:
+            continue
+        # 4. 跳过名称长度不一致的情况
+        elif len(list_title) != len(plex_title):
+            continue
+        # # 4. 跳过名称第一个字拼音不一样的情况
+        # elif pinyin(list_title[0]) != pinyin(plex_title[0]):
+        #     continue
+        else:
+            pass
+
+        ratio = difflib.SequenceMatcher(None, list_fillstring, plex_fillstring).quick_ratio()
+
+        # 1. 相似度 = 1 视为完全匹配，结束查询
+        if ratio == 1:
+            temp_index, temp_media, temp_ratio = index, media, ratio
+            massage = '精准匹配'
+            break
+        # 2. 名称完全相同，年份完全相同的，视为完全匹配，结束查询
+        #    即忽略副标题不同，或片名没有写第几部的情况
+        if list_title == plex_title and list_year == plex_year:
+            temp_index, temp_media, temp_ratio = index, media, ratio
+            if list_part != plex_part and list_index == plex_index:
+                massage = '分集名称不同'
+            elif list_part == plex_part and list_index != plex_index:
+                massage = '集数不同'
+            else:
+                massage = '集数与分集名称都不同'
+            break
+        # 3. 相似度 > 0.8 ，名称拼音完全相同，年份完全相同的，视为完全匹配，结束查询
+        #    即忽略标题简繁不一、副标题不同，或片名没有写第几部的情况，
+        if ratio > 0.8 and pinyin(list_title) == pinyin(plex_title) and list_year == plex_year:
+            temp_index, temp_media, temp_ratio = index, media, ratio
+            if list_part == plex_part and list_index == plex_index:
+                massage = '简繁不一致'
+            elif list_part != plex_part and list_index == plex_index:
+                massage = '简繁不一致且分集名称不同'
+            elif list_part == plex_part and list_index != plex_index:
+                massage = '简繁不一致且集数不同'
+            else:
+                massage = '简繁不一致且集数和分集名称都不同'
+            break
+        # 4. 相似度 > 0.8 ，视为模糊匹配，并试图寻找下一个更相似的匹配
+        if ratio > 0.8 and ratio > temp_ratio:
+            temp_index, temp_media, temp_ratio = index, media, ratio
+            numtrans = str.maketrans('123456789', '一二三四五六七八九')
+
+            # a. 如果电影名完全相同，集数也相同，上映年份相差不到两年
+            #    即忽略分集标题差异，忽略上映年份的小差异
+            if list_title == plex_title and list_index == plex_index:
+                if list_part == plex_part:
+                    massage = '上映年份不同'
+                else:
+                    massage = '上映年份和分集名称都不同'
+
+            # a. 如果电影名完全除了阿拉伯数字之外相同，集数也相同，上映年份相差不到两年
+            #    即忽略分集标题差异，忽略上映年份的小差异
+            if list_title.translate(numtrans) == plex_title.translate(numtrans) and list_index == plex_index:
+                massage = '名称中存在阿拉伯数字'
+
+    return temp_index, temp_media, temp_ratio, massage
+
+
+def main(baseurl: str, token: str, playlist_id='top250', renew=False, force=False, chunksize=250):
+    """
+    同步一个豆瓣列表到 plex 播放列表。列表按 chunksize 分批读取、匹配并追加到播放列表。
+    :return: 列表缓存为空，或列表和电影库自上次同步后都没有变化而跳过时返回 False，否则返回 True
+    """
+    t1 = int(time.time() * 1000)
+    playlist_id = str(playlist_id)
+
+    playlist_name, playlist_count = get_douban_playlist(playlist_id, renew, chunksize)
+    logging.warning(f'{Fore.GREEN}已成功获取 {playlist_name} 中的 {playlist_count} 个电影。{Fore.RESET}')
+
+    # 列表缓存为空时不连接 plex，避免删除已有的播放列表
+    if not playlist_count:
+        logging.error(f'{playlist_name} 的列表缓存为空，跳过。')
+        return False
+
+    douban_playlist_hash, synced_hash, synced_library = get_synced_state(playlist_id)
+    douban_library_state = library_state(baseurl, token)
+    t2 = int(time.time() * 1000)
+
+    if (not force and douban_playlist_hash and douban_playlist_hash == synced_hash
+            and douban_library_state == synced_library and playlist_exists(baseurl, token, playlist_name)):
+        logging.warning(f'{Fore.GREEN}{playlist_name} 和电影库自上次同步后都没有变化，跳过。{Fore.RESET}')
+        logging.info(f'msg="已跳过 {playlist_name}。" duration={(int(time.time() * 1000) - t1)}ms')
+        return False
+    logging.info(f'msg="开始同步 {playlist_name}。" duration={(t2 - t1)}ms')
+
+    from pypinyin import pinyin
+    from plexapi.myplex import PlexServer
+
     try:
         client = PlexServer(baseurl, token)
     except Exception as e:
@@ -295,11 +583,7 @@ def main(baseurl: str, token: str, playlist_id='top250', renew=False):
 
     medias = list_media(client, {'movie': ['movie']})
     logging.warning(f'{Fore.GREEN}电影库中共计 {len(medias)} 个电影。{Fore.RESET}')
-
-    playlist_id = str(playlist_id)
-
-    playlist_name, douban_playlist = get_douban_playlist(playlist_id, renew)
-    logging.warning(f'{Fore.GREEN}已成功获取 {playlist_name} 中的 {len(douban_playlist)} 个电影。{Fore.RESET}')
+    library, years = index_media(medias)
 
     try:
         playlist = client.playlist(title=playlist_name)
@@ -307,144 +591,80 @@ def main(baseurl: str, token: str, playlist_id='top250', renew=False):
     except Exception as e:
         logging.debug(e)
 
-    playlist_media_items = []
-
-    for item in douban_playlist:
-        temp_index = None
-        temp_media = None
-        temp_ratio = 0
-        massage = ''
-
-        for index, media in enumerate(medias):
-            try:
-                list_movie, list_year = remove_punctuation(item[1]), item[3]
-                plex_movie, plex_year = remove_punctuation(media[1]), media[3]
-
-                list_title, list_index, list_part = split_movie_name(list_movie)
-                plex_title, plex_index, plex_part = split_movie_name(plex_movie)
-                year_deviation = abs(int(list_year) - int(plex_year))
-
-            # 1. 跳过无法提取信息的
-            except Exception as e:
-                logging.debug(e)
-                continue
-
-            # 2. 跳过上映年份差距大于2年的
-            if year_deviation > 2:
-                continue
-            # 3. 跳过有集数但集数不同的情况
-            elif list_index != plex_index and list_index and plex_index:
-                continue
-            # 4. 跳过名称长度不一致的情况
-            elif len(list_title) != len(plex_title):
-                continue
-            # # 4. 跳过名称第一个字拼音不一样的情况
-            # elif pinyin(list_title[0]) != pinyin(plex_title[0]):
-            #     continue
-            else:
-                pass
+    playlist = None
+    matched_count = 0
+    consumed = set()
 
-            list_fillstring = list_movie.replace('：', '') + '*' * (11 - len(list_movie)) + list_year
-            plex_fillstring = plex_movie.replace('：', '') + '*' * (11 - len(plex_movie)) + plex_year
+    for douban_playlist in read_data(playlist_id, chunksize):
+        playlist_media_items = []
 
-            ratio = difflib.SequenceMatcher(None, list_fillstring, plex_fillstring).quick_ratio()
-
-            # 1. 相似度 = 1 视为完全匹配，结束查询
-            if ratio == 1:
-                temp_index, temp_media, temp_ratio, temp_deviation = index, media[0], ratio, year_deviation
-                massage = '精准匹配'
-                break
-            # 2. 名称完全相同，年份完全相同的，视为完全匹配，结束查询
-            #    即忽略副标题不同，或片名没有写第几部的情况
-            if list_title == plex_title and list_year == plex_year:
-                temp_index, temp_media, temp_ratio, temp_deviation = index, media[0], ratio, year_deviation
-                if list_part != plex_part and list_index == plex_index:
-                    massage = '分集名称不同'
-                elif list_part == plex_part and list_index != plex_index:
-                    massage = '集数不同'
-                else:
-                    massage = '集数与分集名称都不同'
-                break
-            # 3. 相似度 > 0.8 ，名称拼音完全相同，年份完全相同的，视为完全匹配，结束查询
-            #    即忽略标题简繁不一、副标题不同，或片名没有写第几部的情况，
-            if ratio > 0.8 and pinyin(list_title) == pinyin(plex_title) and list_year == plex_year:
-                temp_index, temp_media, temp_ratio, temp_deviation = index, media[0], ratio, year_deviation
-                if list_part == plex_part and list_index == plex_index:
-                    massage = '简繁不一致'
-                elif list_part != plex_part and list_index == plex_index:
-                    massage = '简繁不一致且分集名称不同'
-                elif list_part == plex_part and list_index != plex_index:
-                    massage = '简繁不一致且集数不同'
+        for item in douban_playlist:
+            temp_index, temp_media, temp_ratio, massage = match_media(item, library, years, consumed, pinyin)
+
+            def gen_log_msg():
+
+                _item_print = f'{item[0]}\t{item[1]}({item[3]})'
+
+                if not temp_media:
+                    return f'{Fore.RED}{_item_print} 不存在。{Fore.RESET}'
+
+                _plex_print = f'{temp_media.title}({temp_media.year})'
+
+                if massage == '精准匹配':
+                    return f'{Fore.GREEN}{_item_print} 精准匹配。{Fore.RESET}'
+                elif massage:
+                    return (f'{Fore.CYAN}{_item_print} 与 {_plex_print} 模糊匹配(相似度{round(temp_ratio, 2)})，'
+                            f'存在问题：{massage}。{Fore.RESET}')
                 else:
-                    massage = '简繁不一致且集数和分集名称都不同'
-                break
-            # 4. 相似度 > 0.8 ，视为模糊匹配，并试图寻找下一个更相似的匹配
-            if ratio > 0.8 and ratio > temp_ratio:
-                temp_index, temp_media, temp_ratio, temp_deviation = index, media[0], ratio, year_deviation
-                numtrans = str.maketrans('123456789', '一二三四五六七八九')
-
-                # a. 如果电影名完全相同，集数也相同，上映年份相差不到两年
-                #    即忽略分集标题差异，忽略上映年份的小差异
-                if list_title == plex_title and list_index == plex_index:
-                    if list_part == plex_part:
-                        massage = '上映年份不同'
-                    else:
-                        massage = '上映年份和分集名称都不同'
-
-                # a. 如果电影名完全除了阿拉伯数字之外相同，集数也相同，上映年份相差不到两年
-                #    即忽略分集标题差异，忽略上映年份的小差异
-                if list_title.translate(numtrans) == plex_title.translate(numtrans) and list_index == plex_index:
-                    massage = '名称中存在阿拉伯数字'
-
-        def gen_log_msg():
-
-            _item_print = f'{item[0]}\t{item[1]}({item[3]})'
-
-            if not temp_media:
-                return f'{Fore.RED}{_item_print} 不存在。{Fore.RESET}'
-
-            _plex_print = f'{temp_media.title}({temp_media.year})'
-
-            if massage == '精准匹配':
-                return f'{Fore.GREEN}{_item_print} 精准匹配。{Fore.RESET}'
-            elif massage:
-                return (f'{Fore.CYAN}{_item_print} 与 {_plex_print} 模糊匹配(相似度{round(temp_ratio, 2)})，'
-                        f'存在问题：{massage}。{Fore.RESET}')
+                    return (f'{Fore.RED}{_item_print} 与 {_plex_print} 模糊匹配(相似度{round(temp_ratio, 2)})，'
+                            f'但未命中匹配规则，不会加入列表中。{Fore.RESET}')
+
+            # 完全相同
+            if temp_media and temp_ratio == 1.0 and massage:
+                logging.info(gen_log_msg())
+                playlist_media_items.append(temp_media)
+                consumed.add(temp_index)
+            # 模糊匹配
+            elif temp_media and massage:
+                logging.error(gen_log_msg())
+                playlist_media_items.append(temp_media)
+                consumed.add(temp_index)
+            # 模糊匹配不入列
+            elif temp_media and not massage:
+                logging.error(gen_log_msg())
+            # 无匹配
             else:
-                return (f'{Fore.RED}{_item_print} 与 {_plex_print} 模糊匹配(相似度{round(temp_ratio, 2)})，'
-                        f'但未命中匹配规则，不会加入列表中。{Fore.RESET}')
-
-        # 完全相同
-        if temp_media and temp_ratio == 1.0 and massage:
-            logging.info(gen_log_msg())
-            playlist_media_items.append(temp_media)
-            medias.pop(temp_index)
-        # 模糊匹配
-        elif temp_media and massage:
-            logging.error(gen_log_msg())
-            playlist_media_items.append(temp_media)
-            medias.pop(temp_index)
-        # 模糊匹配不入列
-        elif temp_media and not massage:
-            logging.error(gen_log_msg())
-        # 无匹配
-        else:
-            logging.error(gen_log_msg())
+                logging.error(gen_log_msg())
 
-    if playlist_media_items:
-        client.createPlaylist(title=playlist_name, items=playlist_media_items)
-        logging.warning(f'{Fore.CYAN}共计匹配到 {len(playlist_media_items)}/{len(douban_playlist)} 个项目。{Fore.RESET}')
+        # 每批匹配完成后追加到播放列表
+        if playlist_media_items:
+            if playlist is None:
+                playlist = client.createPlaylist(title=playlist_name, items=playlist_media_items)
+            else:
+                playlist.addItems(playlist_media_items)
+            matched_count += len(playlist_media_items)
+
+    if playlist is not None:
+        set_synced_state(playlist_id, douban_playlist_hash, douban_library_state)
+        logging.warning(f'{Fore.CYAN}共计匹配到 {matched_count}/{playlist_count} 个项目。{Fore.RESET}')
     else:
         logging.error('没有匹配到该列表中的任何电影。')
 
+    logging.info(f'msg="已完成同步 {playlist_name}。" duration={(int(time.time() * 1000) - t1)}ms')
+    return True
 
-if __name__ == '__main__':
-    Config = loadconfig()
-    Renew = False
+
+def run(argv=None):
+    Config = loadconfig(argv)
     for playlistid in Config.playlist:
-        main(Config.baseurl, Config.token, playlistid, Renew)
-        if Renew:
+        if not main(Config.baseurl, Config.token, playlistid, Config.renew, Config.force, Config.chunksize):
+            continue
+        if Config.renew:
             time.sleep(5)
         else:
             time.sleep(0.5)
         print('\n\n\n')
+
+
+if __name__ == '__main__':
+    run()
@@ -3,12 +3,9 @@ import logging
 import os
 import time
 from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import yaml
-import requests
-import pypinyin
-import plexapi.media
-from plexapi.myplex import PlexServer
 
 logging.basicConfig(level=logging.INFO)
 
@@ -38,6 +35,8 @@ plexapi_reload_options = {
 def loadtags(source):
     if source.startswith('http://') or source.startswith('https://'):
         # 如果是 URL，使用 requests 获取内容
+        import requests
+
         response = requests.get(source)
         response.raise_for_status()  # 确保请求成功
         data = yaml.safe_load(response.text)
@@ -51,7 +50,7 @@ def loadtags(source):
             return yaml.safe_load(file)
 
 
-def loadconfig():
+def loadconfig(argv=None):
     def load_allow_libs(yaml_file_path):
         try:
             with open(yaml_file_path, 'r', encoding='utf-8') as file:
@@ -110,7 +109,10 @@ def loadconfig():
         parser.add_argument('--sorttitle', default=True, type=bool, required=False, help="开启标题排序")
         parser.add_argument('--transtags', default=True, type=bool, required=False, help="开启标签翻译")
         parser.add_argument('--tagsfile', default="https://mirror.ghproxy.com/raw.githubusercontent.com/sqkkyzx/plex_localization_zhcn/main/tags.yaml", type=str, required=False, help="配置文件路径")
-        args = parser.parse_args()
+        parser.add_argument('--workers', default=8, type=int, required=False, help="解除标签锁定时的并发请求数")
+        args = parser.parse_args(argv)
+        if args.workers < 1:
+            parser.error("--workers 不能小于 1")
 
         class _cfg:
             configfile = args.configfile
@@ -120,6 +122,7 @@ def loadconfig():
             sorttitle = args.sorttitle
             transtags = args.transtags
             tagsfile = args.tagsfile
+            workers = args.workers
 
         return _cfg
 
@@ -129,6 +132,7 @@ def loadconfig():
     _allow_tags_ = load_allow_tags(args_cfg.configfile)
 
     if file_cfg:
+        file_cfg.workers = args_cfg.workers
         return file_cfg, _allow_libs_, _allow_tags_
     else:
         if not args_cfg.baseurl or not args_cfg.token:
@@ -143,6 +147,8 @@ def has_chinese(string):
 
 def convert_sort_to_pinyin(text):
     """将字符串转换为拼音首字母形式。"""
+    import pypinyin
+
     pinyin_list = pypinyin.pinyin(text, style=pypinyin.FIRST_LETTER)
     pinyin_str = ''.join([item[0].upper() for item in pinyin_list])
     return pinyin_str.translate(str.maketrans("：（），", ":(),"))
@@ -179,9 +185,10 @@ def op_sort(media):
         logging.info(f"Set <{media.title}> SortTitle to [{new_sort_title}]")
 
 
-def op_tag(media: plexapi.media, transdict: dict, trans_tagset: set, allow_libs, allow_tags, baseurl, token):
+def op_tag(media, transdict: dict, trans_tagset: set, allow_libs, allow_tags, baseurl, token):
     _allow_types = [item for item in chain.from_iterable(allow_libs.values()) if item != 'collection']
     if media.type in _allow_types:
+        import requests
 
         metadata = requests.get(
             url=f'{baseurl}{media.key}', headers={'X-Plex-Token': token, 'Accept': 'application/json'}
@@ -202,6 +209,12 @@ def main(
         tag_source: str,
         allow_libs: dict, allow_tags: dict,
 ):
+    if not sortTitle and not transTags:
+        logging.info('msg="未开启任何任务。"')
+        return
+
+    from plexapi.myplex import PlexServer
+
     try:
         client = PlexServer(baseurl, token)
     except Exception as e:
@@ -234,22 +247,60 @@ def main(
     logging.info(f'msg="全部任务已完成。" duration={(t4 - t1)}ms')
 
 
-def removeTagLock(baseurl, token, days, allow_libs, allow_tags):
+def locked_fields(media):
+    """列表接口返回的 Field 即为媒体已锁定的字段。"""
+    # 直接读取列表返回的 XML，media.fields 为空列表时会触发一次完整的 reload
+    return {field.get('name') for field in media._data.findall('Field') if field.get('locked') == '1'}
+
+
+def op_unlock(media, tag_names: list[str]):
+    # 一次请求解锁全部标签，不需要 reload
+    media.edit(**{f'{tag_name.lower()}.locked': 0 for tag_name in tag_names})
+    logging.info(F"Unlock <{media.title}> {tag_names}")
+
+
+def removeTagLock(baseurl, token, days, allow_libs, allow_tags, workers: int = 8):
+    from plexapi.myplex import PlexServer
+
     client = PlexServer(baseurl, token)
-    op_medias = list_media(client, allow_libs, days)
+    t1 = int(time.time() * 1000)
+
+    # 合集没有标签，直接不请求
+    _allow_libs = {k: [item for item in v if item != 'collection'] for k, v in allow_libs.items()}
+    op_medias = list_media(client, _allow_libs, days)
+
+    op_unlocks = []
     for op_media in op_medias:
-        _allow_types = [item for item in chain.from_iterable(allow_libs.values()) if item != 'collection']
-        if op_media.type not in _allow_types:
-            continue
-        for tag_name, tag_name_s in allow_tags.items():
-            op_media.editTags(tag_name_s, [], False, True).reload()
-            logging.info(F"Unlock <{op_media.title}> {tag_name}")
-    logging.info('Unlock All Tag')
+        fields = locked_fields(op_media)
+        tag_names = [tag_name for tag_name in allow_tags if tag_name.lower() in fields]
+        if tag_names:
+            op_unlocks.append((op_media, tag_names))
+    t2 = int(time.time() * 1000)
+    logging.info(f'msg="{len(op_medias)} 个媒体中有 {len(op_unlocks)} 个存在锁定的标签。" duration={(t2 - t1)}ms')
 
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(op_unlock, op_media, tag_names): op_media for op_media, tag_names in op_unlocks}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(F"Unlock <{futures[future].title}> failed: {e}")
+    t3 = int(time.time() * 1000)
+    logging.info(f'msg="Unlock All Tag" duration={(t3 - t2)}ms')
 
-if __name__ == '__main__':
-    Config, AllowLibs, AllowTags = loadconfig()
+
+def run(argv=None):
+    Config, AllowLibs, AllowTags = loadconfig(argv)
     main(
         Config.baseurl, Config.token, Config.daysago, Config.sorttitle, Config.transtags, Config.tagsfile,
         AllowLibs, AllowTags
     )
+
+
+def run_unlock(argv=None):
+    Config, AllowLibs, AllowTags = loadconfig(argv)
+    removeTagLock(Config.baseurl, Config.token, Config.daysago, AllowLibs, AllowTags, Config.workers)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,33 @@
+import sys
+import time
+import logging
+import argparse
+import importlib
+
+T0 = time.perf_counter()
+
+COMMANDS = {
+    'sync-douban': ('douban_top250_sync.douban_top250_sync', 'run', '同步豆瓣列表到 plex 播放列表'),
+    'localize': ('media_metadata_to_zhcn.media_metadata_to_zhcn', 'run', '将媒体元数据转换为中文'),
+    'unlock-tags': ('media_metadata_to_zhcn.media_metadata_to_zhcn', 'run_unlock', '解除标签锁定'),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="我的 Plex 实用脚本。")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (_, _, helptext) in COMMANDS.items():
+        subparsers.add_parser(name, help=helptext, add_help=False)
+    args, rest = parser.parse_known_args(argv)
+
+    # 只导入所选子命令的模块，各模块的重量级依赖也只在用到时才导入
+    module_name, func_name, _ = COMMANDS[args.command]
+    func = getattr(importlib.import_module(module_name), func_name)
+    logging.info(f'msg="已加载 {args.command}。" duration={int((time.perf_counter() - T0) * 1000)}ms')
+    result = func(rest)
+    logging.info(f'msg="{args.command} 已结束。" duration={int((time.perf_counter() - T0) * 1000)}ms')
+    return result
+
+
+if __name__ == '__main__':
+    sys.exit(main())